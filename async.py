@@ -1,10 +1,16 @@
+import argparse
 import asyncio
 
 import httpx
-from aiofiles import open, os
 from tqdm import tqdm
 
 from src.hitomi import HitomiDownloader
+from src.jobqueue import from_args, group, spawn
+from src.jobqueue import parser as queue_parser
+from src.storage import LocalStorage
+from src.storage import from_args as storage_from_args
+from src.storage import parser as storage_parser
+from src.tracing import parser, run
 
 
 def print(*args, **kwargs):
@@ -13,6 +19,8 @@ def print(*args, **kwargs):
 
 async def download_all_async(
     downloader: HitomiDownloader,
+    storage: LocalStorage,
+    id: str,
     output: str,
     desc: str,
     data: dict,
@@ -20,10 +28,15 @@ async def download_all_async(
     semaphore: asyncio.Semaphore = asyncio.Semaphore(10),
 ) -> None:
     async with semaphore:
-        for i, url in enumerate(tqdm(urls, leave=False, desc=desc)):
-            bin = await downloader.save(url, data)
-            async with open(f"{output}/{i:04}.webp", "wb") as f:
-                await f.write(bin)
+        gallery = await storage.open(output)
+        try:
+            for i, url in enumerate(tqdm(urls, leave=False, desc=desc)):
+                bin = await downloader.save(url, data)
+                await gallery.write(f"{i:04}.webp", bin)
+            await gallery.commit(id=id, title=desc)
+        except BaseException:
+            await gallery.abort()
+            raise
 
 
 async def get_data(
@@ -44,32 +57,67 @@ async def get_galleryblock(
         return id, *(await downloader.galleryblock(id))
 
 
-async def main():
+async def prepare_artist(
+    downloader: HitomiDownloader,
+    storage: LocalStorage,
+    file: str,
+    ids: list[str],
+) -> list[tuple]:
+    artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
+    artist_filename = downloader.sanitize_filename(artist)
+
+    manga = []
+    future = [get_galleryblock(downloader, id) for id in ids]
+    data_list = await asyncio.gather(*future)
+    for id, data, urls in data_list:
+        title = downloader.get_title(data)
+        output = f"output/{artist_filename}/{title}_{id}"
+        if not await storage.complete(output):
+            manga.append((id, output, title, data, urls))
+    return manga
+
+
+async def main(args: argparse.Namespace):
     client = httpx.AsyncClient(timeout=None)
     downloader = await HitomiDownloader.factrory(client)
     artist = await downloader.input("input.txt")
+    storage = storage_from_args(args)
 
-    artist_url = [f"https://hitomi.la/artist/{file}.html" for file in artist]
-    ids_list = await asyncio.gather(*[get_data(downloader, url) for url in artist_url])
+    try:
+        if args.queue is not None:
 
-    manga = []
+            async def handler(files: list[str]):
+                for file in files:
+                    ids = await get_data(downloader, f"https://hitomi.la/artist/{file}.html")
+                    manga = await prepare_artist(downloader, storage, file, ids)
+                    await asyncio.gather(*[download_all_async(downloader, storage, *item) for item in manga])
+
+            queue = from_args(args)
+            await queue.enqueue(group(artist, downloader.get_artist))
+            await queue.work(handler, args.jobs)
+            return
+
+        artist_url = [f"https://hitomi.la/artist/{file}.html" for file in artist]
+        ids_list = await asyncio.gather(*[get_data(downloader, url) for url in artist_url])
+
+        manga = {}
+
+        for file, ids in zip(artist, ids_list):
+            for item in await prepare_artist(downloader, storage, file, ids):
+                # Entries such as foo-all and foo-japanese list the same galleries.
+                manga.setdefault(item[1], item)
 
-    for file, ids in zip(artist, ids_list):
-        artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
-        artist_filename = downloader.sanitize_filename(artist)
+        tasks = [download_all_async(downloader, storage, *args) for args in manga.values()]
 
-        future = [get_galleryblock(downloader, id) for id in ids]
-        data_list = await asyncio.gather(*future)
-        for id, data, urls in data_list:
-            title = downloader.get_title(data)
-            output = f"output/{artist_filename}/{title}_{id}"
-            await os.makedirs(output, exist_ok=True)
-            manga.append((output, title, data, urls))
+        await asyncio.gather(*tasks)
+    finally:
+        storage.close()
 
-    tasks = [download_all_async(downloader, *args) for args in manga]
 
-    await asyncio.gather(*tasks)
+def entry(args: argparse.Namespace):
+    run(main(args), args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = argparse.ArgumentParser(parents=[parser(), queue_parser(), storage_parser()]).parse_args()
+    spawn(entry, args)
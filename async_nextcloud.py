@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import urllib.parse
 
@@ -7,8 +8,14 @@ from tqdm import tqdm
 
 from src.config import Settings
 from src.hitomi import HitomiDownloader
+from src.jobqueue import from_args, group, spawn
+from src.jobqueue import parser as queue_parser
 from src.manager import TagManager
 from src.nextcloud import NextCloud
+from src.postprocess import THUMBNAIL_NAME, PostProcessor
+from src.postprocess import from_args as postprocess_from_args
+from src.postprocess import parser as postprocess_parser
+from src.tracing import parser, run
 
 TEMP_PREFIX = "temp-"
 
@@ -26,6 +33,7 @@ async def download_all_async(
     downloader: HitomiDownloader,
     tag: TagManager,
     nextcloud: NextCloud,
+    postprocess: PostProcessor,
     output: str,
     output2: str,
     desc: str,
@@ -39,7 +47,9 @@ async def download_all_async(
         assert field_id is not None
         for i, url in enumerate(tqdm(urls, leave=False, desc=desc)):
             bin = await downloader.save(url, data)
-            await nextcloud.upload(f"{output2}/{i:04}.webp", bin)
+            if i == 0 and (thumbnail := await postprocess.thumbnail(bin)) is not None:
+                await nextcloud.upload(f"{output2}/{THUMBNAIL_NAME}", thumbnail)
+            await nextcloud.upload(f"{output2}/{i:04}.webp", await postprocess.page(bin))
         tags = [
             *downloader.get_tags(data),
             *downloader.get_series(data),
@@ -72,7 +82,39 @@ async def get_galleryblock(
         return await downloader.galleryblock(id)
 
 
-async def main():
+async def prepare_artist(
+    downloader: HitomiDownloader,
+    nextcloud: NextCloud,
+    file: str,
+    ids: list[str],
+    end_tag: str,
+) -> list[tuple]:
+    artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
+    artist_filename = downloader.sanitize_filename(artist)
+
+    await nextcloud.mkdir(artist_filename)
+    images = await nextcloud.path_list(artist_filename)
+    displaynames = [displayname for _, _, _, _, displayname, _ in images[1:]]
+    for displayname in displaynames:
+        if displayname.startswith(TEMP_PREFIX):
+            print(f"Delete {displayname}")
+            await nextcloud.delete(f"{artist_filename}/{displayname}")
+
+    manga = []
+    future = [get_galleryblock(downloader, id) for id in ids]
+    data_list = await asyncio.gather(*future)
+    for id, (data, urls) in zip(ids, data_list):
+        title = downloader.get_title(data)
+        artist_unquote = urllib.parse.unquote(artist)
+        output = f"{artist_unquote}/{int(id):09}_{title}"
+        output2 = f"{artist}/{TEMP_PREFIX}{int(id):09}"
+        if f"{int(id):09}" not in [x.split("_")[0] for x in displaynames]:
+            print(f"Download {output}")
+            manga.append((output, output2, title, data, urls, end_tag))
+    return manga
+
+
+async def main(args: argparse.Namespace):
     client = httpx.AsyncClient(timeout=None)
     downloader = await HitomiDownloader.factrory(client)
     env = Settings()
@@ -80,40 +122,45 @@ async def main():
     nextcloud.cd(env.path)
     tag = await TagManager.facory(nextcloud)
     artist = await downloader.input("input.txt")
-
-    artist_url = [f"https://hitomi.la/artist/{file}.html" for file in artist]
-    ids_list = await asyncio.gather(*[get_data(downloader, url) for url in artist_url])
     invisible_tag_id = await tag.get_tag_id(env.invisible_tags, hidden=True)
+    postprocess = postprocess_from_args(args)
 
-    manga = []
+    try:
+        if args.queue is not None:
+
+            async def handler(files: list[str]):
+                # Entries of one artist share its temp- folders, so they run one after another.
+                for file in files:
+                    ids = await get_data(downloader, f"https://hitomi.la/artist/{file}.html")
+                    manga = await prepare_artist(downloader, nextcloud, file, ids, invisible_tag_id)
+                    await asyncio.gather(
+                        *[download_all_async(downloader, tag, nextcloud, postprocess, *item) for item in manga]
+                    )
+
+            queue = from_args(args)
+            await queue.enqueue(group(artist, downloader.get_artist))
+            await queue.work(handler, args.jobs)
+            return
+
+        artist_url = [f"https://hitomi.la/artist/{file}.html" for file in artist]
+        ids_list = await asyncio.gather(*[get_data(downloader, url) for url in artist_url])
+
+        manga = []
 
-    for file, ids in zip(artist, ids_list):
-        artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
-        artist_filename = downloader.sanitize_filename(artist)
+        for file, ids in zip(artist, ids_list):
+            manga.extend(await prepare_artist(downloader, nextcloud, file, ids, invisible_tag_id))
 
-        await nextcloud.mkdir(artist_filename)
-        images = await nextcloud.path_list(artist_filename)
-        displaynames = [displayname for _, _, _, _, displayname, _ in images[1:]]
-        for displayname in displaynames:
-            if displayname.startswith(TEMP_PREFIX):
-                print(f"Delete {displayname}")
-                await nextcloud.delete(f"{artist_filename}/{displayname}")
+        tasks = [download_all_async(downloader, tag, nextcloud, postprocess, *args) for args in manga]
 
-        future = [get_galleryblock(downloader, id) for id in ids]
-        data_list = await asyncio.gather(*future)
-        for id, (data, urls) in zip(ids, data_list):
-            title = downloader.get_title(data)
-            artist_unquote = urllib.parse.unquote(artist)
-            output = f"{artist_unquote}/{int(id):09}_{title}"
-            output2 = f"{artist}/{TEMP_PREFIX}{int(id):09}"
-            if f"{int(id):09}" not in [x.split("_")[0] for x in displaynames]:
-                print(f"Download {output}")
-                manga.append((output, output2, title, data, urls, invisible_tag_id))
+        await asyncio.gather(*tasks)
+    finally:
+        postprocess.close()
 
-    tasks = [download_all_async(downloader, tag, nextcloud, *args) for args in manga]
 
-    await asyncio.gather(*tasks)
+def entry(args: argparse.Namespace):
+    run(main(args), args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = argparse.ArgumentParser(parents=[parser(), queue_parser(), postprocess_parser()]).parse_args()
+    spawn(entry, args)
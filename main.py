@@ -1,31 +1,67 @@
+import argparse
 import asyncio
 
 import httpx
-from aiofiles import open, os
 from tqdm import tqdm
 
 from src.hitomi import HitomiDownloader
+from src.jobqueue import from_args, group, spawn
+from src.jobqueue import parser as queue_parser
+from src.storage import LocalStorage
+from src.storage import from_args as storage_from_args
+from src.storage import parser as storage_parser
+from src.tracing import parser, run
 
 
-async def main():
+async def download_artist(downloader: HitomiDownloader, storage: LocalStorage, file: str):
+    artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
+    url = f"https://hitomi.la/artist/{file}.html"
+    artist_filename = downloader.sanitize_filename(artist)
+    for id in tqdm(await downloader.get_data(url), leave=False, desc=artist):
+        data, urls = await downloader.galleryblock(id)
+        title = downloader.get_title(data)
+        output = f"output/{artist_filename}/{title}_{id}"
+        if await storage.complete(output):
+            continue
+        gallery = await storage.open(output)
+        try:
+            for i, url in enumerate(tqdm(urls, leave=False, desc=title)):
+                bin = await downloader.save(url, data)
+                await gallery.write(f"{i:04}.webp", bin)
+            await gallery.commit(id=id, title=title)
+        except BaseException:
+            await gallery.abort()
+            raise
+
+
+async def main(args: argparse.Namespace):
     client = httpx.AsyncClient(timeout=None)
     downloader = await HitomiDownloader.factrory(client)
     artist = await downloader.input("input.txt")
-    for file in tqdm(artist, leave=False):
-        artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
-        url = f"https://hitomi.la/artist/{file}.html"
-        artist_filename = downloader.sanitize_filename(artist)
-        await os.makedirs(f"output/{artist_filename}", exist_ok=True)
-        for id in tqdm(await downloader.get_data(url), leave=False, desc=artist):
-            data, urls = await downloader.galleryblock(id)
-            title = downloader.get_title(data)
-            output = f"output/{artist_filename}/{title}_{id}"
-            await os.makedirs(output, exist_ok=True)
-            for i, url in enumerate(tqdm(urls, leave=False, desc=title)):
-                bin = await downloader.save(url, data)
-                async with open(f"{output}/{i:04}.webp", "wb") as f:
-                    await f.write(bin)
+    storage = storage_from_args(args)
+
+    try:
+        if args.queue is not None:
+
+            async def handler(files: list[str]):
+                for file in files:
+                    await download_artist(downloader, storage, file)
+
+            queue = from_args(args)
+            await queue.enqueue(group(artist, downloader.get_artist))
+            await queue.work(handler, args.jobs)
+            return
+
+        for file in tqdm(artist, leave=False):
+            await download_artist(downloader, storage, file)
+    finally:
+        storage.close()
+
+
+def entry(args: argparse.Namespace):
+    run(main(args), args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = argparse.ArgumentParser(parents=[parser(), queue_parser(), storage_parser()]).parse_args()
+    spawn(entry, args)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 
 import httpx
@@ -5,15 +6,57 @@ from tqdm import tqdm
 
 from src.config import Settings
 from src.hitomi import HitomiDownloader
+from src.jobqueue import from_args, group, spawn
+from src.jobqueue import parser as queue_parser
 from src.manager import TagManager
 from src.nextcloud import NextCloud
+from src.postprocess import THUMBNAIL_NAME, PostProcessor
+from src.postprocess import from_args as postprocess_from_args
+from src.postprocess import parser as postprocess_parser
+from src.tracing import parser, run
 
 
 def print(*args, **kwargs):
     tqdm.write(" ".join(map(str, args)), **kwargs)
 
 
-async def main():
+async def upload_artist(
+    downloader: HitomiDownloader,
+    tag: TagManager,
+    nextcloud: NextCloud,
+    postprocess: PostProcessor,
+    file: str,
+):
+    artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
+    url = f"https://hitomi.la/artist/{file}.html"
+    artist_filename = downloader.sanitize_filename(artist)
+    await nextcloud.mkdir(artist_filename)
+    for id in tqdm(await downloader.get_data(url), leave=False, desc=artist):
+        data, urls = await downloader.galleryblock(id)
+        title = downloader.get_title(data)
+        output = f"output/{artist_filename}/{title}_{id}"
+        field_id = await nextcloud.mkdir(output)
+        if field_id is None:
+            print(f"Skip {title}")
+        else:
+            for i, url in enumerate(tqdm(urls, leave=False, desc=title)):
+                bin = await downloader.save(url, data)
+                if i == 0 and (thumbnail := await postprocess.thumbnail(bin)) is not None:
+                    await nextcloud.upload(f"{output}/{THUMBNAIL_NAME}", thumbnail)
+                await nextcloud.upload(f"{output}/{i:04}.webp", await postprocess.page(bin))
+
+            tags = [
+                *downloader.get_tags(data),
+                *downloader.get_series(data),
+                *downloader.get_characters(data),
+            ]
+
+            for tag_name in tags:
+                tag_id = await tag.get_tag_id(tag_name)
+                await nextcloud.assign_tag(field_id, tag_id)
+
+
+async def main(args: argparse.Namespace):
     client = httpx.AsyncClient(timeout=None)
     downloader = await HitomiDownloader.factrory(client)
     env = Settings()
@@ -21,34 +64,30 @@ async def main():
     nextcloud.cd(env.path)
     tag = await TagManager.facory(nextcloud)
     artist = await downloader.input("input.txt")
+    postprocess = postprocess_from_args(args)
+
+    try:
+        if args.queue is not None:
+
+            async def handler(files: list[str]):
+                for file in files:
+                    await upload_artist(downloader, tag, nextcloud, postprocess, file)
+
+            queue = from_args(args)
+            await queue.enqueue(group(artist, downloader.get_artist))
+            await queue.work(handler, args.jobs)
+            return
+
+        for file in tqdm(artist, leave=False):
+            await upload_artist(downloader, tag, nextcloud, postprocess, file)
+    finally:
+        postprocess.close()
+
 
-    for file in tqdm(artist, leave=False):
-        artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
-        url = f"https://hitomi.la/artist/{file}.html"
-        artist_filename = downloader.sanitize_filename(artist)
-        await nextcloud.mkdir(artist_filename)
-        for id in tqdm(await downloader.get_data(url), leave=False, desc=artist):
-            data, urls = await downloader.galleryblock(id)
-            title = downloader.get_title(data)
-            output = f"output/{artist_filename}/{title}_{id}"
-            field_id = await nextcloud.mkdir(output)
-            if field_id is None:
-                print(f"Skip {title}")
-            else:
-                for i, url in enumerate(tqdm(urls, leave=False, desc=title)):
-                    bin = await downloader.save(url, data)
-                    await nextcloud.upload(f"{output}/{i:04}.webp", bin)
-
-                tags = [
-                    *downloader.get_tags(data),
-                    *downloader.get_series(data),
-                    *downloader.get_characters(data),
-                ]
-
-                for tag_name in tags:
-                    tag_id = await tag.get_tag_id(tag_name)
-                    await nextcloud.assign_tag(field_id, tag_id)
+def entry(args: argparse.Namespace):
+    run(main(args), args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = argparse.ArgumentParser(parents=[parser(), queue_parser(), postprocess_parser()]).parse_args()
+    spawn(entry, args)
@@ -10,6 +10,8 @@ import httpx
 from aiofiles import open
 from tenacity import retry, stop_after_attempt, wait_random
 
+from src.tracing import traced
+
 
 @dataclass
 @dataclass
@@ -45,6 +47,7 @@ class Hitomi:
         self.client = client
         self.headers = headers
 
+    @traced()
     async def request(
         self,
         url: str,
@@ -57,6 +60,7 @@ class Hitomi:
         assert response.status_code >= 200 and response.status_code < 300
         return response
 
+    @traced()
     async def get_data(self, input: str) -> list[str]:
         url = input.replace("hitomi.la", "ltn.gold-usergeneratedcontent.net", 1).replace(
             ".html", ".nozomi", 1
@@ -70,6 +74,7 @@ class Hitomi:
         ]
         return res
 
+    @traced()
     async def gg(self) -> tuple[str, list[str], str, str]:
         response = await self.request("https://ltn.gold-usergeneratedcontent.net/gg.js")
         b = re.search(r"b: '([0-9]+)\/'", response.content.decode()).group(1)  # type: ignore
@@ -82,6 +87,7 @@ class Hitomi:
         m = re.search(r"(..)(.)$", h)
         return str(int(m.group(2) + m.group(1), 16))  # type: ignore
 
+    @traced()
     def subdomain_from_url(self, hash: str, ggm: list[str], ggb: str, ggo: str, ggo2: str, ext: str) -> str:
         b = 16
 
@@ -96,6 +102,7 @@ class Hitomi:
         return f"https://w{subdomain}.gold-usergeneratedcontent.net/{ggb}/{self.s(hash)}/{hash}.webp"
         
 
+    @traced()
     async def galleryblock(self, id: str) -> tuple[dict[str, Any], list[str]]:
         detail = await self.request(f"https://ltn.gold-usergeneratedcontent.net/galleries/{id}.js")
         data = json.loads(detail.content.decode().replace("var galleryinfo = ", ""))
@@ -152,6 +159,10 @@ class HitomiDownloader:
     def sanitize_filename(filename: str) -> str:
         return re.sub(r"[\\/:*?\"<>|#]", "", filename).rstrip(" .")
 
+    def get_artist(self, file: str) -> str:
+        artist, lang = file.rsplit("-", 1) if "-" in file else (file, "all")
+        return self.sanitize_filename(artist)
+
     def get_title(self, data: DataType) -> str:
         title = data.get("japanese_title") or data["title"]
         return self.sanitize_filename(title)
@@ -174,6 +185,7 @@ class HitomiDownloader:
     async def galleryblock(self, id: str):
         return await self.hitomi.galleryblock(id)
 
+    @traced()
     @retry(stop=stop_after_attempt(10), wait=wait_random(0, 10))
     async def save(self, url: str, data: DataType):
         res = await self.hitomi.request(url, {"Referer": self.get_referer(data)})
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from contextlib import asynccontextmanager, closing, contextmanager
+from typing import Awaitable, Callable, Optional
+
+from tqdm import tqdm
+
+
+def print(*args, **kwargs):
+    tqdm.write(" ".join(map(str, args)), **kwargs)
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        lease: float = 300.0,
+        max_attempts: int = 5,
+        retry_delay: float = 30.0,
+        poll: float = 10.0,
+        journal_mode: str = "WAL",
+        worker: Optional[str] = None,
+    ):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll = poll
+        self.journal_mode = journal_mode
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        with self.transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "key TEXT PRIMARY KEY, "
+                "items TEXT NOT NULL DEFAULT '[]', "
+                "status TEXT NOT NULL DEFAULT 'pending', "
+                "owner TEXT, "
+                "expires REAL NOT NULL DEFAULT 0, "
+                "attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    @contextmanager
+    def transaction(self):
+        with closing(sqlite3.connect(self.path, timeout=60, isolation_level=None)) as db:
+            db.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _enqueue(self, jobs: dict[str, list[str]]):
+        with self.transaction() as db:
+            for key, items in jobs.items():
+                row = db.execute("SELECT items FROM jobs WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    db.execute("INSERT INTO jobs (key, items) VALUES (?, ?)", (key, json.dumps(items)))
+                    continue
+                existing = json.loads(row[0])
+                merged = list(dict.fromkeys([*existing, *items]))
+                if len(merged) == len(existing):
+                    continue
+                # Finished jobs run again for the new entries; a leased job notices the change in _complete.
+                db.execute(
+                    "UPDATE jobs SET items = ?, "
+                    "status = CASE WHEN status IN ('done', 'failed') THEN 'pending' ELSE status END, "
+                    "attempts = CASE WHEN status IN ('done', 'failed') THEN 0 ELSE attempts END, "
+                    "expires = CASE WHEN status IN ('done', 'failed') THEN 0 ELSE expires END "
+                    "WHERE key = ?",
+                    (json.dumps(merged), key),
+                )
+
+    def requeue(self):
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL, expires = 0, attempts = 0 "
+                "WHERE status != 'leased' OR expires < ?",
+                (time.time(),),
+            )
+
+    def _claim(self) -> tuple[Optional[str], list[str], Optional[float]]:
+        now = time.time()
+        with self.transaction() as db:
+            # Jobs whose holders kept crashing are given up instead of staying leased forever.
+            db.execute(
+                "UPDATE jobs SET status = 'failed' "
+                "WHERE status IN ('pending', 'leased') AND expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT key, items FROM jobs "
+                "WHERE status IN ('pending', 'leased') AND expires < ? "
+                "ORDER BY expires, rowid LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                # Nothing claimable yet: wait for a retry delay or another worker's lease to run out.
+                (expires,) = db.execute(
+                    "SELECT MIN(expires) FROM jobs WHERE status IN ('pending', 'leased')"
+                ).fetchone()
+                return None, [], None if expires is None else min(max(expires - now, 0.0), self.poll)
+            db.execute(
+                "UPDATE jobs SET status = 'leased', owner = ?, expires = ?, attempts = attempts + 1 WHERE key = ?",
+                (self.worker, now + self.lease, row[0]),
+            )
+        return row[0], json.loads(row[1]), None
+
+    def _renew(self, key: str) -> bool:
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET expires = ? WHERE key = ? AND owner = ? AND status = 'leased'",
+                (time.time() + self.lease, key, self.worker),
+            )
+        return cursor.rowcount == 1
+
+    def _complete(self, key: str, items: list[str]):
+        with self.transaction() as db:
+            # Entries merged in while the job was held were not part of this run.
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN items = ? THEN 'done' ELSE 'pending' END, "
+                "attempts = CASE WHEN items = ? THEN attempts ELSE 0 END, expires = 0 "
+                "WHERE key = ? AND owner = ? AND status = 'leased'",
+                (json.dumps(items), json.dumps(items), key, self.worker),
+            )
+
+    def _release(self, key: str):
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "expires = ? + ? * attempts "
+                "WHERE key = ? AND owner = ? AND status = 'leased'",
+                (self.max_attempts, time.time(), self.retry_delay, key, self.worker),
+            )
+
+    async def enqueue(self, jobs: dict[str, list[str]]):
+        await asyncio.to_thread(self._enqueue, jobs)
+
+    async def claim(self) -> tuple[Optional[str], list[str], Optional[float]]:
+        return await asyncio.to_thread(self._claim)
+
+    @asynccontextmanager
+    async def hold(self, key: str, items: list[str]):
+        task = asyncio.current_task()
+        assert task is not None
+        lost = False
+
+        async def heartbeat():
+            nonlocal lost
+            while True:
+                await asyncio.sleep(self.lease / 3)
+                if not await asyncio.to_thread(self._renew, key):
+                    lost = True
+                    task.cancel()
+                    return
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            yield
+        except BaseException as e:
+            beat.cancel()
+            if lost and isinstance(e, asyncio.CancelledError) and task.uncancel() == 0:
+                raise LeaseLost(key) from None
+            await asyncio.to_thread(self._release, key)
+            raise
+        beat.cancel()
+        await asyncio.to_thread(self._complete, key, items)
+
+    async def work(self, handler: Callable[[list[str]], Awaitable[None]], jobs: int = 1):
+        await asyncio.gather(*[self._work(handler) for _ in range(jobs)])
+
+    async def _work(self, handler: Callable[[list[str]], Awaitable[None]]):
+        while True:
+            key, items, wait = await self.claim()
+            if key is None:
+                if wait is None:
+                    return
+                await asyncio.sleep(wait)
+                continue
+            try:
+                async with self.hold(key, items):
+                    await handler(items)
+            except Exception as e:
+                print(f"Failed {key}: {e!r}")
+
+
+def group(items: list[str], key: Callable[[str], str]) -> dict[str, list[str]]:
+    groups: dict[str, list[str]] = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return groups
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--queue", default=None)
+    parser.add_argument("--lease", type=float, default=300.0)
+    parser.add_argument("--poll", type=float, default=10.0)
+    parser.add_argument("--journal-mode", default="WAL")
+    parser.add_argument("--requeue", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--jobs", type=int, default=4)
+    return parser
+
+
+def from_args(args: argparse.Namespace) -> JobQueue:
+    return JobQueue(args.queue, lease=args.lease, poll=args.poll, journal_mode=args.journal_mode)
+
+
+def spawn(target: Callable[[argparse.Namespace], None], args: argparse.Namespace):
+    if args.queue is None and (args.workers > 1 or args.requeue):
+        raise SystemExit("--workers and --requeue require --queue")
+    if args.queue is not None and args.requeue:
+        from_args(args).requeue()
+    if args.workers <= 1:
+        return target(args)
+    processes = [multiprocessing.Process(target=target, args=(args,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
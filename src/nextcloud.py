@@ -4,6 +4,8 @@ from typing import Optional
 
 import httpx
 
+from src.tracing import span, traced
+
 
 class NextCloud:
     def __init__(
@@ -30,6 +32,7 @@ class NextCloud:
             return file_id
         return None
 
+    @traced()
     async def request(self, method: str, path: str, tags: list):
         root = ET.Element(
             "d:propfind",
@@ -55,22 +58,23 @@ class NextCloud:
             auth=(self.username, self.password),
         )
         assert response.status_code == 207
-        root = ET.fromstring(response.content)
-        tuples = []
-        for response in root.findall(".//d:response", tag_namespace):
-            status = response.find(".//d:status", tag_namespace)
-            if status is not None and status.text == "HTTP/1.1 200 OK":
-                elem = []
-                for tag in tags:
-                    tag_elem = response.find(f".//{tag}", tag_namespace)
-                    if tag_elem is None:
-                        raise Exception(f"Tag {tag} not found")
-                    elif tag_elem.text is None:
-                        tag_elems = response.findall(f".//{tag}/*", tag_namespace)
-                        elem.append([tag_elem.text for tag_elem in tag_elems])
-                    else:
-                        elem.append(tag_elem.text)
-                tuples.append(tuple(elem))
+        with span("NextCloud.request.parse"):
+            root = ET.fromstring(response.content)
+            tuples = []
+            for response in root.findall(".//d:response", tag_namespace):
+                status = response.find(".//d:status", tag_namespace)
+                if status is not None and status.text == "HTTP/1.1 200 OK":
+                    elem = []
+                    for tag in tags:
+                        tag_elem = response.find(f".//{tag}", tag_namespace)
+                        if tag_elem is None:
+                            raise Exception(f"Tag {tag} not found")
+                        elif tag_elem.text is None:
+                            tag_elems = response.findall(f".//{tag}/*", tag_namespace)
+                            elem.append([tag_elem.text for tag_elem in tag_elems])
+                        else:
+                            elem.append(tag_elem.text)
+                    tuples.append(tuple(elem))
         return tuples
 
     async def path_list(self, path) -> list[tuple]:
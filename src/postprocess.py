@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageSequence
+
+from src.tracing import traced
+
+# Hidden so that viewers reading the folder as a page sequence do not show it as a page.
+THUMBNAIL_NAME = ".thumbnail.webp"
+
+
+def make_thumbnail(content: bytes, size: int, quality: int = 80) -> bytes:
+    output = io.BytesIO()
+    with Image.open(io.BytesIO(content)) as image:
+        if getattr(image, "is_animated", False):
+            frames, durations = [], []
+            for frame in ImageSequence.Iterator(image):
+                durations.append(frame.info.get("duration", 100))
+                frame = frame.copy()
+                frame.thumbnail((size, size))
+                frames.append(frame)
+            frames[0].save(
+                output,
+                "WEBP",
+                quality=quality,
+                save_all=True,
+                append_images=frames[1:],
+                duration=durations,
+                loop=image.info.get("loop", 0),
+            )
+        else:
+            image.thumbnail((size, size))
+            image.save(output, "WEBP", quality=quality)
+    return output.getvalue()
+
+
+def reencode(content: bytes, quality: int, max_side: Optional[int], budget: Optional[int]) -> bytes:
+    with Image.open(io.BytesIO(content)) as image:
+        # Animated pages are kept as served; saving a single frame would turn them into stills.
+        if getattr(image, "is_animated", False):
+            return content
+        size = image.size
+        if max_side is not None:
+            image.thumbnail((max_side, max_side))
+        resized = image.size != size
+        while True:
+            output = io.BytesIO()
+            image.save(output, "WEBP", quality=quality)
+            if budget is None or output.tell() <= budget or quality <= 10:
+                break
+            quality -= 10
+    if not resized and output.tell() >= len(content):
+        return content
+    return output.getvalue()
+
+
+class PostProcessor:
+    def __init__(
+        self,
+        thumbnail_size: Optional[int] = None,
+        quality: Optional[int] = None,
+        max_side: Optional[int] = None,
+        budget: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+        self.max_side = max_side
+        self.budget = budget
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def reencoding(self) -> bool:
+        return self.quality is not None or self.max_side is not None or self.budget is not None
+
+    async def run(self, func, *args):
+        if self.executor is None:
+            # Threads already exist by now (queue heartbeats, writer pools), so never fork.
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @traced()
+    async def thumbnail(self, content: bytes) -> Optional[bytes]:
+        if self.thumbnail_size is None:
+            return None
+        return await self.run(make_thumbnail, content, self.thumbnail_size)
+
+    @traced()
+    async def page(self, content: bytes) -> bytes:
+        if not self.reencoding:
+            return content
+        quality = 90 if self.quality is None else self.quality
+        return await self.run(reencode, content, quality, self.max_side, self.budget)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--thumbnail", type=int, nargs="?", const=512, default=None)
+    parser.add_argument("--page-quality", type=int, default=None)
+    parser.add_argument("--page-max-side", type=int, default=None)
+    parser.add_argument("--page-budget", type=int, default=None)
+    parser.add_argument("--postprocess-workers", type=int, default=None)
+    return parser
+
+
+def from_args(args: argparse.Namespace) -> PostProcessor:
+    return PostProcessor(
+        thumbnail_size=args.thumbnail,
+        quality=args.page_quality,
+        max_side=args.page_max_side,
+        budget=args.page_budget,
+        workers=args.postprocess_workers,
+    )
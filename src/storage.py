@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.tracing import traced
+
+MANIFEST_NAME = "manifest.json"
+TEMP_PREFIX = ".tmp-"
+TRASH_PREFIX = ".old-"
+
+_counter = itertools.count()
+
+
+
+
+def write_batch(path: str, batch: list[tuple[str, bytes]], fsync: bool):
+    for name, content in batch:
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(content)
+            if fsync:
+                os.fsync(f.fileno())
+
+
+def sweep(parent: str, stale: float):
+    # Writers on any host keep touching their temp directory, so only abandoned ones get old.
+    limit = time.time() - stale
+    with os.scandir(parent) as entries:
+        for entry in entries:
+            if entry.name.startswith((TEMP_PREFIX, TRASH_PREFIX)) and entry.stat().st_mtime < limit:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def prepare(path: str, temp: str, stale: Optional[float]):
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    if stale is not None:
+        sweep(parent, stale)
+    os.mkdir(temp)
+
+
+def commit(path: str, temp: str, trash: str, manifest: dict, fsync: bool):
+    with open(os.path.join(temp, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    if os.path.exists(path):
+        # Galleries written before atomic commits have no manifest and may be partial.
+        os.rename(path, trash)
+        os.rename(temp, path)
+        shutil.rmtree(trash, ignore_errors=True)
+    else:
+        os.rename(temp, path)
+    if fsync:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class Gallery:
+    def __init__(self, storage: "LocalStorage", path: str):
+        parent, name = os.path.split(path)
+        self.storage = storage
+        self.path = path
+        suffix = f"{socket.gethostname()}-{os.getpid()}-{next(_counter)}"
+        self.temp = os.path.join(parent, f"{TEMP_PREFIX}{name}.{suffix}")
+        self.trash = os.path.join(parent, f"{TRASH_PREFIX}{name}.{suffix}")
+        self.pending: list[tuple[str, bytes]] = []
+        self.size = 0
+        self.pages = 0
+        self.flushing: Optional[asyncio.Future] = None
+
+    async def write(self, name: str, content: bytes):
+        self.pending.append((name, content))
+        self.size += len(content)
+        self.pages += 1
+        if self.size >= self.storage.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        # Keep one batch in flight so downloading continues while the previous batch is written.
+        if self.flushing is not None:
+            await self.flushing
+            self.flushing = None
+        if self.pending:
+            batch, self.pending, self.size = self.pending, [], 0
+            self.flushing = self.storage.run(write_batch, self.temp, batch, self.storage.fsync)
+
+    @traced()
+    async def commit(self, **manifest):
+        await self.flush()
+        if self.flushing is not None:
+            await self.flushing
+        manifest = {**manifest, "pages": self.pages}
+        await self.storage.run(commit, self.path, self.temp, self.trash, manifest, self.storage.fsync)
+
+    async def abort(self):
+        if self.flushing is not None:
+            try:
+                await self.flushing
+            except Exception:
+                pass
+            self.flushing = None
+        self.pending, self.size = [], 0
+        await self.storage.run(shutil.rmtree, self.temp, True)
+
+
+class LocalStorage:
+    def __init__(
+        self,
+        writers: int = 4,
+        batch_size: int = 8 * 1024 * 1024,
+        fsync: bool = False,
+        stale: float = 3600.0,
+    ):
+        self.executor = ThreadPoolExecutor(writers, thread_name_prefix="writer")
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.stale = stale
+        self.swept: set[str] = set()
+
+    def run(self, func, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def complete(self, path: str) -> bool:
+        return await self.run(os.path.exists, os.path.join(path, MANIFEST_NAME))
+
+    async def open(self, path: str) -> Gallery:
+        gallery = Gallery(self, path)
+        # Each directory is swept for leftovers once per run, not on every open.
+        parent = os.path.dirname(path) or "."
+        stale = None if parent in self.swept else self.stale
+        self.swept.add(parent)
+        await self.run(prepare, path, gallery.temp, stale)
+        return gallery
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch-mib", type=int, default=8)
+    parser.add_argument("--fsync", action="store_true")
+    parser.add_argument("--stale-hours", type=float, default=1.0)
+    return parser
+
+
+def from_args(args: argparse.Namespace) -> LocalStorage:
+    return LocalStorage(args.writers, args.batch_mib * 1024 * 1024, args.fsync, args.stale_hours * 3600)
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+Stack = tuple[str, ...]
+
+
+@dataclass
+class SpanStat:
+    count: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    self_wall: float = 0.0
+    self_cpu: float = 0.0
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+class _Frame:
+    def __init__(self, name: str):
+        parent = _frame.get()
+        self.stack: Stack = (*parent.stack, name) if parent is not None else (name,)
+        self.task = _current_task()
+        # Spans awaited in the same task run inside this frame's steps. Children started with
+        # gather/create_task run in their own steps, so only the wall time the frame spent
+        # waiting for them (the union of their intervals) is taken off its self time.
+        same_task = parent is not None and parent.task is self.task
+        self.parent = parent if same_task else None
+        self.spawner = None if same_task else parent
+        self.start = time.perf_counter()
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.intervals: list[tuple[float, float]] = []
+
+    def covered(self, end: float) -> float:
+        total, last = 0.0, self.start
+        for start, stop in sorted(self.intervals):
+            start, stop = max(start, last), min(stop, end)
+            if stop > start:
+                total += stop - start
+                last = stop
+        return total
+
+
+_frame: contextvars.ContextVar[Optional[_Frame]] = contextvars.ContextVar("frame", default=None)
+
+
+class _Traced:
+    def __init__(self, profiler: "Profiler", name: str, coro: Coroutine):
+        self.profiler = profiler
+        self.name = name
+        self.coro = coro
+
+    def __await__(self):
+        # Drive the coroutine step by step so that only the time it actually
+        # spends on the event loop is counted as CPU time.
+        frame = _Frame(self.name)
+        it = self.coro.__await__()
+        value: Any = None
+        error: Optional[BaseException] = None
+        cpu = 0.0
+        try:
+            while True:
+                token = _frame.set(frame)
+                start = time.thread_time()
+                try:
+                    future = it.send(value) if error is None else it.throw(error)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    cpu += time.thread_time() - start
+                    _frame.reset(token)
+                try:
+                    value, error = (yield future), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            self.profiler.record(frame, time.perf_counter() - frame.start, cpu)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stats: dict[Stack, SpanStat] = defaultdict(SpanStat)
+        self.lag: list[float] = []
+
+    def record(self, frame: _Frame, wall: float, cpu: float):
+        stat = self.stats[frame.stack]
+        stat.count += 1
+        stat.wall += wall
+        stat.cpu += cpu
+        stat.self_wall += max(wall - frame.child_wall - frame.covered(frame.start + wall), 0.0)
+        stat.self_cpu += max(cpu - frame.child_cpu, 0.0)
+        if frame.parent is not None:
+            frame.parent.child_wall += wall
+            frame.parent.child_cpu += cpu
+        elif frame.spawner is not None:
+            frame.spawner.intervals.append((frame.start, frame.start + wall))
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        frame = _Frame(name)
+        token = _frame.set(frame)
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            _frame.reset(token)
+            self.record(frame, time.perf_counter() - frame.start, time.thread_time() - cpu)
+
+    def trace(self, name: str, coro: Coroutine) -> _Traced:
+        return _Traced(self, name, coro)
+
+    async def monitor(self, interval: float, threshold: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = loop.time() - start - interval
+            self.lag.append(lag)
+            if lag > threshold:
+                logger.warning("Event loop lag %.3fs", lag)
+
+    async def collect(self, main: Coroutine, output: str, threshold: float):
+        loop = asyncio.get_running_loop()
+        loop.slow_callback_duration = threshold
+        self.enabled = True
+        monitor = asyncio.create_task(self.monitor(threshold / 2, threshold))
+        try:
+            return await self.trace("main", main)
+        finally:
+            monitor.cancel()
+            self.enabled = False
+            self.dump(output)
+
+    def folded(self, kind: str) -> list[tuple[Stack, float]]:
+        # Concurrent tasks each contribute their own time, so the wall graph is in task-seconds.
+        return [(stack, getattr(stat, f"self_{kind}")) for stack, stat in self.stats.items()]
+
+    def summary(self) -> dict[str, SpanStat]:
+        spans: dict[str, SpanStat] = defaultdict(SpanStat)
+        for stack, stat in self.stats.items():
+            span = spans[stack[-1]]
+            span.count += stat.count
+            span.wall += stat.wall
+            span.cpu += stat.cpu
+        return spans
+
+    def dump(self, output: str):
+        for kind in ("wall", "cpu"):
+            with open(f"{output}.{kind}.folded", "w", encoding="utf-8") as f:
+                for stack, value in self.folded(kind):
+                    f.write(f"{';'.join(stack)} {round(value * 1_000_000)}\n")
+
+        spans = sorted(self.summary().items(), key=lambda x: x[1].cpu, reverse=True)
+        print(f"{'span':<40} {'count':>8} {'wall':>10} {'cpu':>10}")
+        for name, stat in spans:
+            print(f"{name:<40} {stat.count:>8} {stat.wall:>10.3f} {stat.cpu:>10.3f}")
+        if self.lag:
+            lag = sorted(self.lag)
+            p95 = lag[int(len(lag) * 0.95)]
+            print(f"event loop lag: max {lag[-1]:.3f}s p95 {p95:.3f}s")
+
+
+profiler = Profiler()
+
+
+def span(name: str):
+    return profiler.span(name)
+
+
+def traced(name: Optional[str] = None):
+    def decorator(func):
+        label = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not profiler.enabled:
+                    return await func(*args, **kwargs)
+                return await profiler.trace(label, func(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.span(label):
+                return func(*args, **kwargs)
+
+        return sync_wrapper
+
+    return decorator
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", nargs="?", const="profile", default=None)
+    parser.add_argument("--slow-callback", type=float, default=0.1)
+    parser.add_argument("--debug-loop", action="store_true")
+    return parser
+
+
+def run(main: Coroutine, args: argparse.Namespace) -> Any:
+    if args.profile is None:
+        return asyncio.run(main)
+    output = args.profile
+    if multiprocessing.parent_process() is not None:
+        output = f"{output}.{os.getpid()}"
+    logging.basicConfig(level=logging.WARNING)
+    # Debug mode names the slow callbacks but records a traceback for every
+    # task and future, which inflates the CPU figures; keep it opt-in.
+    return asyncio.run(profiler.collect(main, output, args.slow_callback), debug=args.debug_loop)